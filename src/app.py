@@ -1,3 +1,18 @@
+import os
+import sys
+import mmap
+import time
+import pickle
+import struct
+import io
+import bisect
+import sqlite3
+import hashlib
+import resource
+import threading
+import concurrent.futures
+from urllib.parse import urlencode
+
 import pandas as pd
 import numpy as np
 
@@ -11,30 +26,169 @@ import plotly.graph_objects as go
 ###################
 ## Utils
 ###################
-def is_attr_invalid( value ):
-  if type(value) is bool:
+# value containing any of these tokens => attribute is absent
+INVALID_ATTR_TOKENS     = ( 'False', 'NONE' )
+# whole value ( stripped, case insensitive ) equal to one of these => attribute is absent
+PLACEHOLDER_ATTR_VALUES = ( '', 'nan', 'none', 'null', 'n/a', 'na', '-', 'tbd', 'unknown' )
+
+def normalize_placeholders( placeholders ):
+  '''
+  stripped, lower case set, the form is_attr_invalid compares against.
+  frozensets are taken as already normalized
+  '''
+  if isinstance( placeholders, frozenset ):
+    return placeholders
+  return frozenset( str(p).strip().lower() for p in placeholders )
+
+HOTEL_ATTRS = frozenset( ['HotelCode',
+                          'HotelName',
+                          'SegmentCategory',
+                          'Services',
+                          'AcceptedPayments',
+                          'CheckInTime',
+                          'CheckOutTime',
+                          'RefPoint',
+                          'Phone',
+                          'PolicyInfo',
+                          'PenaltyDescription',
+                          'TaxPolicies',
+                          'CommissionPolicy',
+                          'Dinning',
+                          'MeetingRooms',
+                          'LanguageSpoken'] )
+
+# unique per hotel, never classified & always counted as available
+IDENTITY_ATTRS = ( 'HotelCode', 'HotelName' )
+
+def is_attr_invalid( value,
+                     invalid_tokens = INVALID_ATTR_TOKENS,
+                     placeholders   = PLACEHOLDER_ATTR_VALUES ):
+  placeholders = normalize_placeholders( placeholders )
+  if isinstance( value, ( bool, np.bool_ ) ):
     return not value
-  if 'False' in value or 'NONE' in value:
+  if value is None or ( isinstance( value, float ) and np.isnan( value ) ):
     return True
+  value = str( value )
+  if value.strip().lower() in placeholders:
+    return True
+  for token in invalid_tokens:
+    if token in value:
+      return True
   return False
 
 def is_hotel_attr( attr ):
-  return attr in ['HotelCode',
-                  'HotelName',
-                  'SegmentCategory',
-                  'Services',
-                  'AcceptedPayments',
-                  'CheckInTime',
-                  'CheckOutTime',
-                  'RefPoint',
-                  'Phone',
-                  'PolicyInfo',
-                  'PenaltyDescription',
-                  'TaxPolicies',
-                  'CommissionPolicy',
-                  'Dinning',
-                  'MeetingRooms',
-                  'LanguageSpoken']
+  return attr in HOTEL_ATTRS
+
+def classify_attr_column( column,
+                          invalid_tokens = INVALID_ATTR_TOKENS,
+                          placeholders   = PLACEHOLDER_ATTR_VALUES ):
+  '''
+  Boolean mask of valid cells, each distinct value is classified once
+  ( factorize, then lookup table ) instead of once per cell
+  '''
+  placeholders = normalize_placeholders( placeholders )
+  codes, uniques = pd.factorize( column )
+  # extra trailing slot catches NaN ( code -1 )
+  lookup = np.zeros( len(uniques) + 1, dtype=bool )
+  for i, value in enumerate( uniques ):
+    lookup[i] = not is_attr_invalid( value, invalid_tokens, placeholders )
+  return lookup[codes]
+
+def bench_attr_classification( rows = 1000000 ):
+  '''
+  baseline paths ( load time value_counts & hotel page per cell check )
+  vs factorize + lookup on synthetic column
+  '''
+  def baseline_is_attr_invalid( value ):
+    # token check before classification was configurable
+    if type(value) is bool:
+      return not value
+    if 'False' in value or 'NONE' in value:
+      return True
+    return False
+  values = np.array( [ 'Free WiFi, Parking', 'False', 'NONE', '', 'N/A', np.nan, True, False,
+                       'Pool', 'Restaurant, Bar' ], dtype=object )
+  column = pd.Series( values[ np.random.default_rng(0).integers( 0, len(values), rows ) ] )
+  # baseline dataStore load : value_counts, token check per distinct value
+  start = time.time()
+  load_count = 0
+  for k,v in column.value_counts().to_dict().items():
+    if baseline_is_attr_invalid( k ):
+      continue
+    load_count += v
+  load_secs = time.time() - start
+  # baseline hotel page : token check on str( dict_values ) of every cell
+  start = time.time()
+  page_count = 0
+  for i, v in column.items():
+    if not baseline_is_attr_invalid( str( { i : v }.values() ) ):
+      page_count += 1
+  page_secs = time.time() - start
+  start = time.time()
+  lookup = classify_attr_column( column )
+  lookup_secs = time.time() - start
+  print( 'rows={rows} baseline_load={a:.3f}s baseline_hotel_page={b:.3f}s factorize_lookup={c:.3f}s'.format(
+           rows = rows, a = load_secs, b = page_secs, c = lookup_secs ) )
+  # new rules also treat NaN, empty & placeholders as absent
+  print( 'valid cells baseline_load={a} baseline_hotel_page={b} factorize_lookup={c}'.format(
+           a = load_count, b = page_count, c = int( lookup.sum() ) ) )
+
+def file_digest( file_path, chunk_size = 1 << 20 ):
+  '''
+  sha256 of file content, used as dataset version
+  '''
+  digest = hashlib.sha256()
+  with open( file_path, 'rb' ) as f:
+    for chunk in iter( lambda: f.read( chunk_size ), b'' ):
+      digest.update( chunk )
+  return digest.hexdigest()
+
+# sha256 of this script, anything derived from the code ( published datastore,
+# cached pages ) must be rebuilt when it changes
+CODE_VERSION = file_digest( os.path.abspath( __file__ ) )
+
+##########################################
+## Packed string column
+##########################################
+class stringColumn( object ):
+  '''
+  utf-8 strings in one byte buffer + offsets. Only numpy arrays, so a
+  published datastore maps them out-of-band & workers share one copy
+  instead of unpickling a python str per row.
+  '''
+  def __init__( self, values ):
+    encoded = [ str(v).encode( 'utf-8' ) for v in values ]
+    self.offsets = np.zeros( len(encoded) + 1, dtype=np.int64 )
+    np.cumsum( [ len(e) for e in encoded ], out=self.offsets[1:] )
+    self.buffer = np.frombuffer( b''.join( encoded ), dtype=np.uint8 )
+  
+  def __len__( self ):
+    return len(self.offsets) - 1
+  
+  def __getitem__( self, i ):
+    return self.buffer[ self.offsets[i] : self.offsets[i+1] ].tobytes().decode( 'utf-8' )
+  
+  def take( self, positions ):
+    '''
+    list of str, one copy of the covered byte span then sliced per row
+    '''
+    positions = np.asarray( positions )
+    if not len(positions):
+      return []
+    starts = self.offsets[ positions ]
+    ends   = self.offsets[ positions + 1 ]
+    low    = starts.min()
+    raw    = self.buffer[ low : ends.max() ].tobytes()
+    return [ raw[ start:end ].decode( 'utf-8' ) for start, end in zip( ( starts - low ).tolist(), ( ends - low ).tolist() ) ]
+  
+  def find( self, value ):
+    '''
+    position of value in a sorted column, None when absent
+    '''
+    i = bisect.bisect_left( self, value )
+    if i < len(self) and self[i] == value:
+      return i
+    return None
 
 ##########################################
 ## pandas datastore, will cache everything
@@ -72,6 +226,8 @@ class dataStore( object ):
                   'SH' : 'Scandic'          ,
                   'SI' : 'Sheraton'         ,
                 },
+                invalid_attr_tokens     = INVALID_ATTR_TOKENS,
+                placeholder_attr_values = PLACEHOLDER_ATTR_VALUES,
               ):
     # save a copy
     self.chain_2_name_map = chain_2_name_map.copy()
@@ -79,6 +235,7 @@ class dataStore( object ):
     
     ##################################
     # read preprocessed pickle file
+    self.version = file_digest( pickle_file_path )
     df = pd.read_pickle( pickle_file_path )
     self.attributes = list( df.columns[:-1] ) # except score
     # drop test hotels
@@ -94,6 +251,8 @@ class dataStore( object ):
     # drop duplicate rows with same hotel name & retain row with higher score
     if not df.HotelName.is_unique:
       df = df.drop_duplicates( subset='HotelName', keep='last' )
+    # index == row position from here on
+    df = df.reset_index( drop=True )
     
     self.total_hotels = len(df)
     
@@ -106,51 +265,629 @@ class dataStore( object ):
     df = df.assign( Chain_URL=chain_url_base_str + df['ChainCode'] )
     df = df.assign( Hotel_URL=hotel_url_base_str + df['HotelCode'] )
     
-    # save a copy
-    self.hotel_df = df
+    # per hotel data kept as numpy only ( shareable ), rows are built on demand
+    # by hotel_rows, ChainCode / ChainName / urls derive from HotelCode
+    self.hotel_url_base_str = hotel_url_base_str
+    self.hotel_codes  = stringColumn( df['HotelCode'] )
+    self.hotel_names  = stringColumn( df['HotelName'] )
+    self.hotel_scores = df['Score'].to_numpy()
     # drop all columns other than HotelCode HotelName ChainCode ChainName Score Chain_URL Hotel_URL
-    self.relevant_df = df.drop( columns=df.loc[0:1, 'SegmentCategory':'Room_Description'].columns.to_list() )
+    relevant_df = df.drop( columns=df.loc[0:1, 'SegmentCategory':'Room_Description'].columns.to_list() )
     
     ##################################
     # Page 1 : Chain data
     self.hotel_chain_df = \
       pd.merge(
-        self.relevant_df.groupby(['ChainCode','ChainName','Chain_URL']).size().reset_index(name='Count'),
-        self.relevant_df.groupby(['ChainCode','ChainName','Chain_URL']).mean().reset_index(),
+        relevant_df.groupby(['ChainCode','ChainName','Chain_URL']).size().reset_index(name='Count'),
+        relevant_df.groupby(['ChainCode','ChainName','Chain_URL']).mean().reset_index(),
         on=['ChainCode', 'ChainName', 'Chain_URL'] )
     self.total_chains = len(self.hotel_chain_df)
     ##################################
-    # Page 2 : per Chain Hotel data
+    # Page 2 : per Chain Hotel data, ( start, stop ) row range
+    # chain rows are contiguous since rows are sorted by HotelCode
     self.per_chain_hotel_data = { }
-    for chaincode in self.hotel_chain_df['ChainCode'].to_list():
-      self.per_chain_hotel_data[chaincode] = {}
-      self.per_chain_hotel_data[chaincode]["dataframe"] = \
-        self.relevant_df.query("ChainCode == '{code}'".format(code=chaincode) )
+    chain_codes = df['ChainCode'].to_numpy()
+    boundaries  = np.flatnonzero( chain_codes[1:] != chain_codes[:-1] ) + 1
+    starts      = np.r_[ 0, boundaries ] if len(df) else boundaries
+    for start, stop in zip( starts, np.r_[ boundaries, len(df) ] ):
+      self.per_chain_hotel_data[ chain_codes[start] ] = { 'start' : int(start), 'stop' : int(stop) }
     #self.hotel_chain_df.sort_values(by='Count')
     #################################
-    # Page 3 : per hotel date will be fetched from hotel_df
-    self.attributes_map = {}
-    for attr in self.attributes:
-      curr_count = 0
-      for k,v in self.hotel_df[attr].value_counts().to_dict().items():
-        if is_attr_invalid( k ):
-          continue
-        curr_count += v
-      self.attributes_map[attr] = curr_count
+    # Page 3 : per hotel data is looked up by find_hotel
+    # columns listed on hotel page, every column except 'Chain_URL', 'Hotel_URL'
+    self.page_3_columns = df.columns[:-2].to_list()
+    # attribute validity per cell, identity & derived columns ( Score, ChainCode,
+    # ChainName ) are always available & skipped, each value there is distinct
+    placeholder_attr_values = normalize_placeholders( placeholder_attr_values )
+    classified_attrs = [ attr for attr in self.attributes if attr not in IDENTITY_ATTRS ]
+    self.attr_valid_df = pd.DataFrame(
+      { attr : classify_attr_column( df[attr], invalid_attr_tokens, placeholder_attr_values )
+        for attr in classified_attrs },
+      index=df.index )
+    self.attributes_map = { attr : int( self.attr_valid_df[attr].sum() ) if attr in self.attr_valid_df else len(df)
+                            for attr in self.attributes }
     self.attr_df = pd.DataFrame( self.attributes_map.items(), columns=["attr","count"] )
+    #################################
+    # Page 2 filters : per value row bitmaps
+    self.facets = facetIndex( df, self.attr_valid_df, classified_attrs )
+  
+  def hotel_rows( self, rows ):
+    '''
+    HotelCode, HotelName, Score, Hotel_URL frame for row positions
+    '''
+    codes = self.hotel_codes.take( rows )
+    return pd.DataFrame( { 'HotelCode' : codes,
+                           'HotelName' : self.hotel_names.take( rows ),
+                           'Score'     : self.hotel_scores[ rows ],
+                           'Hotel_URL' : [ self.hotel_url_base_str + code for code in codes ] },
+                         index=rows )
+  
+  def chain_positions( self, chaincode ):
+    chain = self.per_chain_hotel_data[chaincode]
+    return np.arange( chain['start'], chain['stop'] )
+  
+  def score_order( self, positions ):
+    '''
+    positions sorted by ascending score
+    '''
+    return positions[ np.argsort( self.hotel_scores[ positions ], kind='stable' ) ]
+  
+  def chain_size( self, chaincode ):
+    chain = self.per_chain_hotel_data[chaincode]
+    return chain['stop'] - chain['start']
+  
+  def find_hotel( self, hotelcode ):
+    '''
+    row position of hotelcode, None when unknown
+    '''
+    if not isinstance( hotelcode, str ):
+      return None
+    return self.hotel_codes.find( hotelcode )
     
 
+##########################################################
+## Faceting, bit-packed row bitmaps per facet value
+##########################################################
+# ( label, low, high ) , high exclusive
+SCORE_BANDS = ( ( '0-19', 0, 20 ), ( '20-39', 20, 40 ), ( '40-59', 40, 60 ),
+                ( '60-79', 60, 80 ), ( '80-100', 80, 101 ) )
+# set bits per byte value, & per pair of bytes ( uint16 ) derived from it
+POPCOUNT    = np.array( [ bin(i).count('1') for i in range(256) ], dtype=np.uint8 )
+POPCOUNT_16 = ( POPCOUNT[:,None] + POPCOUNT[None,:] ).ravel()
+
+class facetIndex( object ):
+  '''
+  One packed bitmap ( bit i => hotel row i ) per facet value.
+  Selection is OR within a facet & AND across facets, counts are popcounts.
+  Padding bits past the last row are always clear.
+  Facets : ChainCode, SegmentCategory, present / missing attribute, score band
+  '''
+  def __init__( self, hotel_df, attr_valid_df, attributes,
+                score_bands = SCORE_BANDS, max_values = 50 ):
+    self.size    = len(hotel_df)
+    self.bitmaps = {}
+    self._add_column( 'ChainCode', hotel_df['ChainCode'], max_values=None )
+    # absent segments ( NaN, placeholders, invalid tokens ) are no option
+    segment = hotel_df['SegmentCategory'].astype(str)
+    if 'SegmentCategory' in attr_valid_df:
+      segment = segment.where( attr_valid_df['SegmentCategory'].to_numpy() )
+    self._add_column( 'SegmentCategory', segment, max_values )
+    self.bitmaps['present'] = {}
+    self.bitmaps['missing'] = {}
+    for attr in attributes:
+      valid = attr_valid_df[attr].to_numpy()
+      self.bitmaps['present'][attr] = np.packbits( valid )
+      self.bitmaps['missing'][attr] = np.packbits( ~valid )
+    self.bitmaps['score'] = {}
+    score = hotel_df['Score'].to_numpy()
+    for label, low, high in score_bands:
+      self.bitmaps['score'][label] = np.packbits( ( score >= low ) & ( score < high ) )
+    # every row set, padding bits clear
+    self.all_rows = np.packbits( np.ones( self.size, dtype=bool ) )
+  
+  def _add_column( self, facet, column, max_values ):
+    codes, uniques = pd.factorize( column )
+    counts = np.bincount( codes[ codes >= 0 ], minlength=len(uniques) )
+    # most frequent values only, keeps memory bounded on high cardinality columns
+    keep = np.argsort( -counts, kind='stable' )[ :max_values ]
+    self.bitmaps[facet] = {}
+    for code in keep:
+      self.bitmaps[facet][ uniques[code] ] = np.packbits( codes == code )
+  
+  def values( self, facet ):
+    return list( self.bitmaps[facet].keys() )
+  
+  def select( self, selections, exclude = None ):
+    '''
+    selections : { facet : [ values ] }, empty / None values => no filter
+    '''
+    bits = self.all_rows.copy()
+    for facet, values in selections.items():
+      if not values or facet == exclude:
+        continue
+      bitmaps = self.bitmaps[facet]
+      # missing / present on several attributes must all hold
+      if facet in ( 'present', 'missing' ):
+        for value in values:
+          np.bitwise_and( bits, bitmaps[value], out=bits )
+        continue
+      union = np.zeros_like( bits )
+      for value in values:
+        if value in bitmaps:
+          np.bitwise_or( union, bitmaps[value], out=union )
+      np.bitwise_and( bits, union, out=bits )
+    return bits
+  
+  def count( self, bits ):
+    # two bytes per lookup, odd trailing byte from the byte table
+    pairs = len(bits) // 2
+    total = int( POPCOUNT_16.take( bits[ :pairs * 2 ].view( np.uint16 ) ).sum() )
+    if len(bits) % 2:
+      total += int( POPCOUNT[ bits[-1] ] )
+    return total
+  
+  def facet_counts( self, facet, selections ):
+    '''
+    { value : count } under all other facets selections
+    '''
+    # conjunctive facets count what each extra value would leave
+    exclude = None if facet in ( 'present', 'missing' ) else facet
+    base = self.select( selections, exclude=exclude )
+    # only bytes with selected rows matter, chain rows are contiguous
+    nonzero = np.flatnonzero( base )
+    if not len(nonzero):
+      return { value : 0 for value in self.bitmaps[facet] }
+    first, last = nonzero[0], nonzero[-1] + 1
+    base = base[ first:last ]
+    scratch = np.empty_like( base )
+    return { value : self.count( np.bitwise_and( base, bitmap[ first:last ], out=scratch ) )
+             for value, bitmap in self.bitmaps[facet].items() }
+  
+  def positions( self, bits ):
+    '''
+    hotel row positions
+    '''
+    return np.flatnonzero( np.unpackbits( bits, count=self.size ) )
+
+def bench_facets( rows = 1000000, repeat = 5 ):
+  '''
+  select + live counts + result rows on synthetic hotels
+  '''
+  rng = np.random.default_rng(0)
+  attributes = [ 'Attr{}'.format(i) for i in range(30) ]
+  hotel_df = pd.DataFrame( {
+    'ChainCode'       : rng.choice( [ 'HL', 'MC', 'SI', 'IC', 'RD' ], rows ),
+    'SegmentCategory' : rng.choice( [ 'Luxury', 'Upscale', 'Midscale', 'Economy', 'Resort', 'N/A' ], rows ),
+    'Score'           : rng.integers( 0, 101, rows ),
+  } )
+  attr_valid_df = pd.DataFrame( { attr : rng.random( rows ) < 0.7 for attr in attributes } )
+  attr_valid_df['SegmentCategory'] = classify_attr_column( hotel_df['SegmentCategory'] )
+  start = time.time()
+  facets = facetIndex( hotel_df, attr_valid_df, attributes )
+  build_secs = time.time() - start
+  selections = { 'ChainCode' : [ 'HL' ], 'SegmentCategory' : [ 'Luxury', 'Resort' ],
+                 'present' : [ 'Attr1' ], 'missing' : [ 'Attr2' ], 'score' : [ '60-79', '80-100' ] }
+  timings = []
+  for _ in range( repeat ):
+    start = time.time()
+    bits = facets.select( selections )
+    counts = { facet : facets.facet_counts( facet, selections )
+               for facet in ( 'SegmentCategory', 'present', 'missing', 'score' ) }
+    rows_found = facets.positions( bits )
+    timings.append( time.time() - start )
+  query_secs = sorted( timings )[ len(timings) // 2 ]
+  print( 'rows={rows} build={a:.3f}s select+counts+positions={b:.1f}ms ( median ) matched={c}'.format(
+           rows = rows, a = build_secs, b = query_secs * 1000, c = len(rows_found) ) )
+
+##########################################################
+## Shared read-only datastore ( one loader, many workers )
+##########################################################
+# path of the memory mapped datastore, unset => every worker builds its own
+DATASTORE_MMAP_PATH = os.environ.get( 'HOTEL_DATASTORE_MMAP', None )
+
+MMAP_MAGIC     = b'HCRSTORE'
+# bump when file layout changes
+MMAP_FORMAT    = 4
+MMAP_ALIGNMENT = 64
+# magic, format, code version, dump version, pickle offset, pickle length, buffer count
+MMAP_HEADER    = struct.Struct( '<8sI32s32sQQQ' )
+# buffer offset, buffer length
+MMAP_BUFFER    = struct.Struct( '<QQ' )
+
+def _align( offset ):
+  return ( offset + MMAP_ALIGNMENT - 1 ) // MMAP_ALIGNMENT * MMAP_ALIGNMENT
+
+def memory_usage():
+  '''
+  ( pss, uss ) of this process in MB, shared mapped pages are split between
+  processes in pss & left out of uss. Falls back to peak rss off linux.
+  '''
+  fields = {}
+  try:
+    with open( '/proc/self/smaps_rollup' ) as f:
+      for line in f:
+        name, _, value = line.partition( ':' )
+        if value.strip().endswith( 'kB' ):
+          fields[name] = int( value.split()[0] )
+  except OSError:
+    rss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024
+    return rss, rss
+  return fields['Pss'] / 1024, ( fields['Private_Clean'] + fields['Private_Dirty'] ) / 1024
+
+def publish_datastore( store, mmap_file_path ):
+  '''
+  Loader side : dump processed datastore into a memory mappable file.
+  numpy blocks ( scores, packed hotel strings, validity, facet bitmaps )
+  are written out-of-band ( pickle protocol 5 ) so workers map them
+  without copying, only small chain level tables get unpickled.
+  '''
+  buffers = []
+  state = { k : v for k,v in store.__dict__.items() if k != '_mmap' }
+  payload = pickle.dumps( state, protocol=5, buffer_callback=buffers.append )
+  # layout : header | buffer table | pickle | aligned buffers ...
+  offset = MMAP_HEADER.size + MMAP_BUFFER.size * len(buffers)
+  pickle_offset = offset
+  offset = _align( offset + len(payload) )
+  table = []
+  for buf in buffers:
+    table.append( ( offset, buf.raw().nbytes ) )
+    offset = _align( offset + buf.raw().nbytes )
+  # write to temp file & rename, attached workers keep the old mapping
+  tmp_path = mmap_file_path + '.tmp'
+  with open( tmp_path, 'wb' ) as f:
+    f.write( MMAP_HEADER.pack( MMAP_MAGIC, MMAP_FORMAT, bytes.fromhex( CODE_VERSION ),
+                               bytes.fromhex( store.version ), pickle_offset, len(payload), len(buffers) ) )
+    for entry in table:
+      f.write( MMAP_BUFFER.pack( *entry ) )
+    f.write( payload )
+    for ( buf_offset, _ ), buf in zip( table, buffers ):
+      f.seek( buf_offset )
+      f.write( buf.raw() )
+  os.replace( tmp_path, mmap_file_path )
+  return offset
+
+class _storeUnpickler( pickle.Unpickler ):
+  '''
+  loader runs as __main__, workers import this module under its own name
+  '''
+  def find_class( self, module, name ):
+    if module == '__main__':
+      module = __name__
+    return super().find_class( module, name )
+
+def attach_datastore( mmap_file_path, dump_version = None ):
+  '''
+  Worker side : map published datastore read-only, numeric arrays point
+  straight into the shared page cache.
+  '''
+  with open( mmap_file_path, 'rb' ) as f:
+    mapped = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+  view = memoryview( mapped )
+  magic, layout, code_version, store_version, pickle_offset, pickle_len, buffer_count = \
+    MMAP_HEADER.unpack_from( view, 0 )
+  if magic != MMAP_MAGIC:
+    raise ValueError( "{} is not a published datastore".format( mmap_file_path ) )
+  if layout != MMAP_FORMAT or code_version.hex() != CODE_VERSION:
+    raise ValueError( "{} was published by different code, run --publish again".format( mmap_file_path ) )
+  if dump_version is not None and store_version.hex() != dump_version:
+    raise ValueError( "{} was published from a different dump, run --publish again".format( mmap_file_path ) )
+  buffers = []
+  for i in range( buffer_count ):
+    buf_offset, buf_len = MMAP_BUFFER.unpack_from( view, MMAP_HEADER.size + i * MMAP_BUFFER.size )
+    buffers.append( view[ buf_offset : buf_offset + buf_len ] )
+  state = _storeUnpickler( io.BytesIO( view[ pickle_offset : pickle_offset + pickle_len ] ),
+                           buffers=buffers ).load()
+  store = dataStore.__new__( dataStore )
+  store.__dict__.update( state )
+  # keep mapping alive as long as the datastore
+  store._mmap = mapped
+  return store
+
+def load_datastore( pickle_file_path = './dataDump.zip', mmap_file_path = DATASTORE_MMAP_PATH ):
+  '''
+  Attach to published datastore when available & built from this dump, else build locally
+  '''
+  start = time.time()
+  store = None
+  if mmap_file_path and os.path.exists( mmap_file_path ):
+    try:
+      # content hash, mtimes survive rsync -a / cp -p
+      store = attach_datastore( mmap_file_path, dump_version=file_digest( pickle_file_path ) )
+      mode = 'attached'
+    except Exception as e:
+      # never fail boot on a bad or stale file, build locally instead
+      print( 'Attach failed', mmap_file_path, e )
+  if store is None:
+    store = dataStore( pickle_file_path=pickle_file_path )
+    mode = 'built'
+  pss, uss = memory_usage()
+  print( 'Datastore {mode} pid={pid} boot={secs:.2f}s pss={pss:.1f}MB uss={uss:.1f}MB'.format(
+           mode = mode,
+           pid  = os.getpid(),
+           secs = time.time() - start,
+           pss  = pss,
+           uss  = uss ) )
+  return store
+
+def bench_workers( pickle_file_path = './dataDump.zip', worker_counts = ( 1, 4, 16 ),
+                   mmap_file_path = './bench.mmap' ):
+  '''
+  per worker boot time, pss & uss building a private copy vs attaching the
+  published datastore. Workers are forked & all alive when measured, so
+  sharing is visible in pss. The parent never holds a datastore, the
+  published file is built in a child too.
+  '''
+  import queue
+  import multiprocessing
+  ctx = multiprocessing.get_context( 'fork' )
+  def publish( results ):
+    start = time.time()
+    store = dataStore( pickle_file_path=pickle_file_path )
+    build = time.time() - start
+    results.put( ( build, publish_datastore( store, mmap_file_path ) ) )
+  results = ctx.Queue()
+  proc = ctx.Process( target=publish, args=( results, ) )
+  proc.start()
+  build, size = results.get()
+  proc.join()
+  print( 'local build {:.2f}s published {:.1f}MB'.format( build, size / 1024**2 ) )
+  def worker( mode, barrier, results ):
+    start = time.time()
+    if mode == 'attached':
+      store = attach_datastore( mmap_file_path )
+    else:
+      # what every worker does without a published file
+      store = dataStore( pickle_file_path=pickle_file_path )
+    boot = time.time() - start
+    try:
+      barrier.wait()
+      results.put( ( boot, ) + memory_usage() )
+      barrier.wait()
+    except threading.BrokenBarrierError:
+      # another worker died
+      pass
+  for mode in ( 'private', 'attached' ):
+    for count in worker_counts:
+      barrier = ctx.Barrier( count )
+      results = ctx.Queue()
+      procs = [ ctx.Process( target=worker, args=( mode, barrier, results ) ) for _ in range( count ) ]
+      for proc in procs:
+        proc.start()
+      stats = []
+      while len(stats) < count:
+        try:
+          stats.append( results.get( timeout=1 ) )
+        except queue.Empty:
+          # a worker died ( e.g. oom killed ), release the others
+          if any( proc.exitcode not in ( None, 0 ) for proc in procs ):
+            barrier.abort()
+            break
+      for proc in procs:
+        proc.join()
+      if len(stats) < count:
+        print( '{mode:8} workers={n:2} failed, a worker died ( out of memory ? )'.format( mode=mode, n=count ) )
+        continue
+      print( '{mode:8} workers={n:2} boot={boot:.3f}s pss={pss:.1f}MB uss={uss:.1f}MB total_pss={total:.1f}MB'.format(
+               mode  = mode,
+               n     = count,
+               boot  = sum( s[0] for s in stats ) / count,
+               pss   = sum( s[1] for s in stats ) / count,
+               uss   = sum( s[2] for s in stats ) / count,
+               total = sum( s[1] for s in stats ) ) )
+  os.remove( mmap_file_path )
+
+##########################################################
+## Persistent page cache, survives restarts
+##########################################################
+# path of the sqlite page cache, unset => in-memory caches only
+PAGE_CACHE_PATH     = os.environ.get( 'HOTEL_PAGE_CACHE', None )
+PAGE_CACHE_MAX_SIZE = int( os.environ.get( 'HOTEL_PAGE_CACHE_MB', '256' ) ) * 1024 * 1024
+
+class pageCache( object ):
+  '''
+  Rendered pages keyed by dataset version + code version + route + params,
+  sits below the in-memory page caches. Least recently used pages are
+  evicted once the total size goes above max_size.
+  '''
+  def __init__( self, db_file_path, version, max_size = PAGE_CACHE_MAX_SIZE,
+                touch_batch = 64, touch_interval = 30 ):
+    # pages pickled by other code may lack components later callbacks need
+    self.version  = '{}:{}'.format( version, CODE_VERSION )
+    self.max_size = max_size
+    self.lock     = threading.Lock()
+    # access times are buffered & written in batches, hits stay read only
+    self.touched        = {}
+    self.touch_batch    = touch_batch
+    self.touch_interval = touch_interval
+    self.last_flush     = time.time()
+    # shared between flask threads & gunicorn workers
+    self.db = sqlite3.connect( db_file_path, timeout=30, check_same_thread=False )
+    with self.lock, self.db:
+      self.db.execute( 'PRAGMA journal_mode=WAL' )
+      self.db.execute( '''CREATE TABLE IF NOT EXISTS pages (
+                           key      TEXT PRIMARY KEY,
+                           version  TEXT NOT NULL,
+                           page     BLOB NOT NULL,
+                           size     INTEGER NOT NULL,
+                           accessed REAL NOT NULL )''' )
+      self.db.execute( 'CREATE INDEX IF NOT EXISTS pages_accessed ON pages ( accessed )' )
+      # running total of blob sizes, kept exact by triggers across workers
+      self.db.execute( 'CREATE TABLE IF NOT EXISTS pages_size ( id INTEGER PRIMARY KEY CHECK ( id = 0 ), total INTEGER NOT NULL )' )
+      self.db.execute( 'INSERT OR IGNORE INTO pages_size SELECT 0, COALESCE( SUM(size), 0 ) FROM pages' )
+      self.db.execute( '''CREATE TRIGGER IF NOT EXISTS pages_size_insert AFTER INSERT ON pages
+                         BEGIN UPDATE pages_size SET total = total + new.size; END''' )
+      self.db.execute( '''CREATE TRIGGER IF NOT EXISTS pages_size_update AFTER UPDATE OF size ON pages
+                         BEGIN UPDATE pages_size SET total = total + new.size - old.size; END''' )
+      self.db.execute( '''CREATE TRIGGER IF NOT EXISTS pages_size_delete AFTER DELETE ON pages
+                         BEGIN UPDATE pages_size SET total = total - old.size; END''' )
+      # new dump or new code => everything else is stale
+      self.db.execute( 'DELETE FROM pages WHERE version != ?', ( self.version, ) )
+  
+  def _key( self, route, params ):
+    key = '{}|{}|{}'.format( self.version, route, urlencode( sorted( params.items() ) ) )
+    return hashlib.sha256( key.encode() ).hexdigest()
+  
+  def get( self, route, **params ):
+    key = self._key( route, params )
+    with self.lock:
+      row = self.db.execute( 'SELECT page FROM pages WHERE key = ?', ( key, ) ).fetchone()
+      if row is None:
+        return None
+      self.touched[key] = time.time()
+      if len(self.touched) >= self.touch_batch or time.time() - self.last_flush >= self.touch_interval:
+        with self.db:
+          self._flush_touched()
+    return pickle.loads( row[0] )
+  
+  def put( self, route, page, **params ):
+    key  = self._key( route, params )
+    blob = pickle.dumps( page, protocol=pickle.HIGHEST_PROTOCOL )
+    if len(blob) > self.max_size:
+      return
+    with self.lock, self.db:
+      self.db.execute( '''INSERT INTO pages VALUES ( ?, ?, ?, ?, ? )
+                         ON CONFLICT ( key ) DO UPDATE SET
+                           page = excluded.page, size = excluded.size, accessed = excluded.accessed''',
+                       ( key, self.version, blob, len(blob), time.time() ) )
+      self._flush_touched()
+      self._evict()
+  
+  def _flush_touched( self ):
+    if self.touched:
+      self.db.executemany( 'UPDATE pages SET accessed = ? WHERE key = ?',
+                           [ ( accessed, key ) for key, accessed in self.touched.items() ] )
+      self.touched = {}
+    self.last_flush = time.time()
+  
+  def _evict( self ):
+    total = self.db.execute( 'SELECT total FROM pages_size' ).fetchone()[0]
+    # drop least recently used until under budget, oldest first via index
+    while total > self.max_size:
+      rows = self.db.execute( 'SELECT key, size FROM pages ORDER BY accessed LIMIT 32' ).fetchall()
+      if not rows:
+        break
+      for key, size in rows:
+        self.db.execute( 'DELETE FROM pages WHERE key = ?', ( key, ) )
+        total -= size
+        if total <= self.max_size:
+          break
+
+##########################################################
+## Render executor, bounded queue & per route timeouts
+##########################################################
+RENDER_WORKERS     = int( os.environ.get( 'HOTEL_RENDER_WORKERS', '4' ) )
+RENDER_MAX_PENDING = int( os.environ.get( 'HOTEL_RENDER_QUEUE', '32' ) )
+# seconds a request waits for a cold render before getting a placeholder
+RENDER_TIMEOUTS    = {
+  '/'      : float( os.environ.get( 'HOTEL_RENDER_TIMEOUT_HOME',  '10' ) ),
+  '/chain' : float( os.environ.get( 'HOTEL_RENDER_TIMEOUT_CHAIN', '5' ) ),
+  '/hotel' : float( os.environ.get( 'HOTEL_RENDER_TIMEOUT_HOTEL', '2' ) ),
+}
+
+class renderExecutor( object ):
+  '''
+  Runs page builds on a thread pool. A build that misses its timeout keeps
+  running in background & fills the page cache, the request gets a fallback.
+  Concurrent requests for same page share one build, once max_pending builds
+  are queued / running new ones are shed.
+  '''
+  def __init__( self, max_workers = RENDER_WORKERS, max_pending = RENDER_MAX_PENDING ):
+    self.pool        = concurrent.futures.ThreadPoolExecutor( max_workers=max_workers )
+    self.max_pending = max_pending
+    self.lock        = threading.Lock()
+    self.pending     = {}
+    self.counters    = {
+      'submitted'    : 0,
+      'shared'       : 0,
+      'completed'    : 0,
+      'failed'       : 0,
+      'timeouts'     : 0,
+      'shed'         : 0,
+    }
+  
+  def _done( self, key, future ):
+    with self.lock:
+      self.pending.pop( key, None )
+      if future.exception() is None:
+        self.counters['completed'] += 1
+      else:
+        self.counters['failed'] += 1
+  
+  def submit( self, key, fn, *args ):
+    '''
+    future of the build, None when shed
+    '''
+    with self.lock:
+      future = self.pending.get( key )
+      if future is not None:
+        self.counters['shared'] += 1
+        return future
+      if len(self.pending) >= self.max_pending:
+        self.counters['shed'] += 1
+        return None
+      future = self.pool.submit( fn, *args )
+      self.pending[key] = future
+      self.counters['submitted'] += 1
+    # outside lock, runs inline if build already finished
+    future.add_done_callback( lambda f: self._done( key, f ) )
+    return future
+  
+  def render( self, key, timeout, fallback, fn, *args ):
+    '''
+    fallback( reason ) is returned on shed or timeout
+    '''
+    future = self.submit( key, fn, *args )
+    if future is None:
+      return fallback( 'busy' )
+    try:
+      return future.result( timeout=timeout )
+    except concurrent.futures.TimeoutError:
+      with self.lock:
+        self.counters['timeouts'] += 1
+      return fallback( 'timeout' )
+  
+  def stats( self ):
+    with self.lock:
+      stats = dict( self.counters )
+      stats['queue_depth'] = len(self.pending)
+    stats['max_pending'] = self.max_pending
+    stats['timeouts_s']  = RENDER_TIMEOUTS
+    return stats
+
 ###################################################
 ## Layout details follows -
 ###################################################
+# points drawn on chain graph, larger chains are downsampled
+CHAIN_GRAPH_MAX_POINTS = int( os.environ.get( 'HOTEL_CHAIN_GRAPH_POINTS', '2000' ) )
+# chain page filters, ( facet, dropdown label )
+FACET_LABELS = ( ( 'SegmentCategory', 'Segment'            ),
+                 ( 'present',         'Attributes present' ),
+                 ( 'missing',         'Attributes missing' ),
+                 ( 'score',           'Score band'         ) )
+
 class pages( object ):
-  def __init__(self):
-    self.datastore = dataStore()
+  def __init__(self, datastore=None ):
+    self.datastore = datastore if datastore is not None else load_datastore()
     ##################################
     # Navbar & content cache
     self.page_1 = None
     self.page_2 = {}
     self.page_3 = {}
+    # unfiltered chain graph, navbar, header & facet options
+    self.page_2_parts = {}
+    # optional on-disk tier below in-memory caches
+    self.disk_cache = None
+    if PAGE_CACHE_PATH:
+      self.disk_cache = pageCache( PAGE_CACHE_PATH, self.datastore.version )
+  
+  def _cache_get( self, route, **params ):
+    if self.disk_cache is None:
+      return None
+    return self.disk_cache.get( route, **params )
+  
+  def _cache_put( self, route, page, **params ):
+    if self.disk_cache is not None:
+      self.disk_cache.put( route, page, **params )
   
   def Navbar_2( self,
               chain_df,
@@ -242,13 +979,44 @@ class pages( object ):
       className="dash-bootstrap"
     )
   
+  def _placeholder(self, message, href ):
+    '''
+    lightweight page served when a render misses its budget
+    '''
+    return html.Div(
+      [
+        self.Navbar(chain_df=None),
+        dbc.Container( 
+          [ dbc.Row( [dbc.Col([
+              html.H2( message ),
+              html.A( "Refresh", href=href ),
+            ])] ) ],
+          className="mt-4"),
+      ],
+      className="dash-bootstrap"
+    )
+  
+  def cached_page(self, route, code=None ):
+    '''
+    in-memory cached page or None, never renders
+    '''
+    if route == '/':
+      return self.page_1
+    if route == '/chain':
+      return self.page_2.get( code )
+    return self.page_3.get( code )
+  
   # homepage or summary
   def display_page_1(self):
     if self.page_1:
       return self.page_1
-    self.page_1 = html.Div([], className="dash-bootstrap") 
+    page = self._cache_get( '/' )
+    if page is not None:
+      self.page_1 = page
+      return page
+    page = html.Div([], className="dash-bootstrap")
     # add nav bar
-    self.page_1.children.append(
+    page.children.append(
                           self.Navbar(
                               chain_df = self.datastore.hotel_chain_df.sort_values(by='ChainName'),
                               label_column_name = 'ChainName',
@@ -298,7 +1066,7 @@ class pages( object ):
                                         'rgb(36, 73, 147)'],
                       )]
     # add figures
-    self.page_1.children.append(
+    page.children.append(
                           dbc.Container(
                             [
                               #########################################
@@ -401,35 +1169,35 @@ class pages( object ):
                             fluid=True,
                           ),
                         )
-    return self.page_1
+    # publish only once complete, other threads may be reading the cache
+    self.page_1 = page
+    self._cache_put( '/', page )
+    return page
   
-  # per chain page
-  def display_page_2(self, chaincode ):
-    '''
-    datastore.per_chain_hotel_data is dict
-    '''
-    # try cache
-    if chaincode in self.page_2:
-      return self.page_2[chaincode]
-    if chaincode not in self.datastore.per_chain_hotel_data:
-      return self._404()
-    # tweak data
-    df_score = self.datastore.per_chain_hotel_data[chaincode]["dataframe"].sort_values(by='Score')
-    # create & cache
-    page = html.Div([
-      self.Navbar(
-                  chain_df = pd.concat( [ df_score.tail(10), df_score.head(10) ] ), # top & bottom combined
+  ##################################################################
+  # per chain page, private functions
+  # chain helpers take hotel positions in score order, only drawn rows are materialized
+  def _chain_navbar(self, order ):
+    return self.Navbar(
+                  chain_df = self.datastore.hotel_rows( np.r_[ order[-10:], order[:10] ] ), # top & bottom combined
                   #chain_df = df_score.sample( len(df_score) ), # Random sampling, can set to len
                   #chain_df = df_score, # everything
                   label_column_name = 'HotelName',
                   url_column_name   = 'Hotel_URL',
                   dropdown_label    = 'Hotel Names'
-                 ),
-    ],
-    className="dash-bootstrap")
-    # add content
+                 )
+  
+  def _chain_header(self, count, chaincode ):
+    return "There are total {} hotels under {} chain".format(
+             count, self.datastore.chain_2_name_map.get(chaincode,chaincode))
+  
+  def _chain_figure(self, order ):
+    # evenly spaced over the score order, first & last hotel kept
+    if len(order) > CHAIN_GRAPH_MAX_POINTS:
+      order = order[ np.linspace( 0, len(order) - 1, CHAIN_GRAPH_MAX_POINTS ).round().astype(int) ]
+    df_score = self.datastore.hotel_rows( order )
     # 1. hotel score scatter graph
-    scatter_data = [go.Scatter( x = df_score['HotelName'],
+    scatter_data = [go.Scattergl( x = df_score['HotelName'],
                                 y = df_score['Score'],
                                 mode = 'lines',
                                 marker = {
@@ -439,6 +1207,97 @@ class pages( object ):
                                   'size'      : 8,
                                 },
                               )]
+    return {
+      'data': scatter_data,
+      'layout': go.Layout(
+        title = 'Hotel Attribute Score',
+        xaxis = {'tickangle' : 45, 'title' : 'Hotel Name', 'tickfont' : dict( size=6) },
+        yaxis = {'title': 'Attr Score'},
+        hovermode = 'closest',
+        #margin = dict(t=40, b=0, l=0, r=0),
+      )
+    }
+  
+  def _facet_options(self, counts ):
+    # value with live count
+    return [ { 'label' : '{} ({})'.format( value, count ), 'value' : value }
+             for value, count in counts.items() ]
+  
+  def _facet_controls(self, options ):
+    controls = []
+    for ( facet, label ), facet_options in zip( FACET_LABELS, options ):
+      controls.append(
+        dbc.Col([
+          dbc.Label( label, html_for='facet-'+facet ),
+          dcc.Dropdown(
+            id='facet-'+facet,
+            multi=True,
+            options=facet_options,
+            className="dash-bootstrap",
+          ),
+        ],
+        className="dash-bootstrap",
+        )
+      )
+    return dbc.Row( controls, align="start", className="dash-bootstrap mt-2" )
+  
+  def filter_page_2(self, chaincode, selections ):
+    '''
+    chain graph, navbar, header & facet options for filtered chain
+    '''
+    # nothing selected => what display_page_2 rendered
+    if not any( selections.values() ) and chaincode in self.datastore.per_chain_hotel_data:
+      return self._chain_parts( chaincode )
+    facets = self.datastore.facets
+    selections = dict( selections, ChainCode=[ chaincode ] )
+    order = self.datastore.score_order( facets.positions( facets.select( selections ) ) )
+    options = [ self._facet_options( facets.facet_counts( facet, selections ) )
+                for facet, _ in FACET_LABELS ]
+    return [ self._chain_figure( order ),
+             self._chain_navbar( order ),
+             self._chain_header( len(order), chaincode ) ] + options
+  
+  def _chain_parts(self, chaincode ):
+    '''
+    unfiltered filter_page_2 outputs, built once per chain
+    '''
+    if chaincode in self.page_2_parts:
+      return self.page_2_parts[chaincode]
+    facets = self.datastore.facets
+    selections = { 'ChainCode' : [ chaincode ] }
+    order = self.datastore.score_order( self.datastore.chain_positions( chaincode ) )
+    options = [ self._facet_options( facets.facet_counts( facet, selections ) )
+                for facet, _ in FACET_LABELS ]
+    parts = [ self._chain_figure( order ),
+              self._chain_navbar( order ),
+              self._chain_header( len(order), chaincode ) ] + options
+    self.page_2_parts[chaincode] = parts
+    return parts
+  
+  # per chain page
+  def display_page_2(self, chaincode ):
+    '''
+    datastore.per_chain_hotel_data is dict of row ranges
+    '''
+    # try cache
+    if chaincode in self.page_2:
+      return self.page_2[chaincode]
+    if chaincode not in self.datastore.per_chain_hotel_data:
+      return self._404()
+    page = self._cache_get( '/chain', ChainCode=chaincode )
+    if page is not None:
+      self.page_2[chaincode] = page
+      return page
+    # tweak data, shared with unfiltered filter callback
+    figure, navbar, header, *options = self._chain_parts( chaincode )
+    # create & cache
+    page = html.Div([
+      html.Div( navbar, id='chain-navbar' ),
+      # current chain for filter callback
+      dcc.Store( id='facet-chain', data=chaincode ),
+    ],
+    className="dash-bootstrap")
+    # add content
     page.children.append(
       dbc.Container(
         [
@@ -450,8 +1309,8 @@ class pages( object ):
               dbc.CardBody(
               #"This is some text within a card body"
                html.H2(
-                "There are total {} hotels under {} chain".format(
-                  len(df_score), self.datastore.chain_2_name_map.get(chaincode,chaincode)),
+                header,
+                id='chain-count',
                 ),
               ),
                 style={
@@ -470,23 +1329,14 @@ class pages( object ):
             align="start",
             className="dash-bootstrap",
           ),
+          # filters
+          self._facet_controls( options ),
           # graph 1
           dbc.Row([
             dbc.Col(
             [
               # scatter graph
-              dcc.Graph(
-                          figure = {
-                            'data': scatter_data,
-                            'layout': go.Layout(
-                              title = 'Hotel Attribute Score',
-                              xaxis = {'tickangle' : 45, 'title' : 'Hotel Name', 'tickfont' : dict( size=6) },
-                              yaxis = {'title': 'Attr Score'},
-                              hovermode = 'closest',
-                              #margin = dict(t=40, b=0, l=0, r=0),
-                            )
-                          }
-                        )
+              dcc.Graph( id='chain-graph', figure=figure )
             ],
             className="dash-bootstrap",
             )
@@ -501,6 +1351,7 @@ class pages( object ):
       )
     )
     self.page_2[chaincode] = page
+    self._cache_put( '/chain', page, ChainCode=chaincode )
     return page
   
   ##################################################################
@@ -574,14 +1425,17 @@ class pages( object ):
     # try cache
     if hotelcode in self.page_3:
       return self.page_3[hotelcode]
+    page = self._cache_get( '/hotel', HotelCode=hotelcode )
+    if page is not None:
+      self.page_3[hotelcode] = page
+      return page
     
     # get hotel data
-    curr_hotel_df = self.datastore.hotel_df.query( "HotelCode == '{}'".format( hotelcode ) )
+    position = self.datastore.find_hotel( hotelcode )
     # check for not exitent data
-    if curr_hotel_df.empty:
+    if position is None:
       return self._404()
-    # sieving out irrelevant columns ( 'Chain_URL', 'Hotel_URL' )
-    curr_hotel_df = curr_hotel_df.drop( columns=curr_hotel_df.columns[-2:] )
+    chaincode = hotelcode[0:2]
     ########################################################################
     # 1. fill table rows data
     # collate items
@@ -589,14 +1443,17 @@ class pages( object ):
     available_hotel_attr = []
     not_available_room_attr = []
     not_available_hotel_attr = []
-    for k,v in curr_hotel_df.to_dict().items():
+    valid_row = self.datastore.attr_valid_df.iloc[ position ]
+    for k in self.datastore.page_3_columns:
+      # unclassified columns are always available
+      v = valid_row.get( k, True )
       if is_hotel_attr( k ):
-        if is_attr_invalid( str(v.values()) ):
+        if not v:
           not_available_hotel_attr.append( k )
         else:
           available_hotel_attr.append( k )
       else:
-        if is_attr_invalid( str(v.values()) ):
+        if not v:
           not_available_room_attr.append( k )
         else:
           available_room_attr.append( k )
@@ -615,12 +1472,9 @@ class pages( object ):
       [
       dbc.Container(
         [
-          html.H1( curr_hotel_df.HotelName.to_list()[0], className="display-3"),
-          html.P( "Falls under " + curr_hotel_df.ChainName + " which has " + 
-                  str(
-                    len(
-                      self.datastore.per_chain_hotel_data[curr_hotel_df.ChainCode.to_list()[0]]['dataframe']
-                      )) +
+          html.H1( self.datastore.hotel_names[ position ], className="display-3"),
+          html.P( "Falls under " + self.datastore.chain_2_name_map.get( chaincode, chaincode ) + " which has " + 
+                  str( self.datastore.chain_size( chaincode ) ) +
                   " more listed properties",
                 className="lead",
           ),
@@ -718,13 +1572,62 @@ class pages( object ):
     )
     # create & cache
     self.page_3[hotelcode] = page
+    self._cache_put( '/hotel', page, HotelCode=hotelcode )
     return page
 
+def bench_chain_filter( rows = 1000000, chains = 10, repeat = 5 ):
+  '''
+  pages.filter_page_2 end to end ( facets, rows, figure, navbar, options )
+  on a synthetic dump, one chain holds rows / chains hotels
+  '''
+  import json
+  import tempfile
+  import plotly
+  rng = np.random.default_rng(0)
+  chain_codes = [ 'HL', 'MC', 'SI', 'IC', 'RD', 'CP', 'DT', 'HI', 'PU', 'SB' ][ :chains ]
+  values = np.array( [ 'Available', 'False', 'NONE', 'N/A', '' ], dtype=object )
+  dump = { 'HotelCode'       : [ '{}{:07d}'.format( c, i ) for i, c in enumerate( rng.choice( chain_codes, rows ) ) ],
+           'HotelName'       : [ 'Hotel {}'.format( i ) for i in range( rows ) ],
+           'SegmentCategory' : rng.choice( np.array( [ 'Luxury', 'Upscale', 'Midscale', 'Economy', 'N/A' ], dtype=object ), rows ) }
+  for attr in [ 'Services', 'PolicyInfo', 'Phone', 'RoomTypeCode', 'Amenity', 'Room_Description' ]:
+    dump[attr] = values[ rng.integers( 0, len(values), rows ) ]
+  dump['Score'] = rng.random( rows )
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    pickle_file_path = os.path.join( tmp_dir, 'dataDump.zip' )
+    pd.DataFrame( dump ).to_pickle( pickle_file_path )
+    store = dataStore( pickle_file_path=pickle_file_path )
+  store_pages = pages( datastore=store )
+  cases = [ ( 'none',                   {} ),
+            ( 'segment',                { 'SegmentCategory' : [ 'Luxury' ] } ),
+            ( 'segment+present+score',  { 'SegmentCategory' : [ 'Luxury', 'Upscale' ],
+                                          'present'         : [ 'Services' ],
+                                          'score'           : [ '80-100' ] } ) ]
+  for name, selections in cases:
+    timings = []
+    serialized = []
+    for _ in range( repeat ):
+      start = time.time()
+      outputs = store_pages.filter_page_2( chain_codes[0], selections )
+      timings.append( time.time() - start )
+      # what dash does with the callback outputs before responding
+      start = time.time()
+      json.dumps( outputs, cls=plotly.utils.PlotlyJSONEncoder )
+      serialized.append( timings[-1] + time.time() - start )
+    hotels = store.facets.count( store.facets.select( dict( selections, ChainCode=[ chain_codes[0] ] ) ) )
+    print( 'rows={rows} filter={name:22} hotels={hotels:6} points={points:5} callback={cb:.1f}ms with_json={js:.1f}ms ( medians )'.format(
+             rows   = rows,
+             name   = name,
+             hotels = hotels,
+             points = len( outputs[0]['data'][0].y ),
+             cb     = sorted( timings )[ len(timings) // 2 ] * 1000,
+             js     = sorted( serialized )[ len(serialized) // 2 ] * 1000 ) )
+
 ###############################################################
 ## Index / callable details
 ###############################################################
+import flask
 from dash.dependencies import Input, Output
-from urllib.parse import urlparse, parse_qsl, urlencode
+from urllib.parse import urlparse, parse_qsl
 def decode_url( href ):
   # href example : http://127.0.0.1:8050/hotel?ChainCode=HL&ChainCode=BJS705
   parsed_href = urlparse( href )
@@ -735,6 +1638,8 @@ def decode_url( href ):
 app = dash.Dash(  __name__,   external_stylesheets=[dbc.themes.BOOTSTRAP], )
 
 app.config.suppress_callback_exceptions = True
+# wsgi entry point, gunicorn app:server
+server = app.server
 
 app.layout = html.Div([
     dcc.Location(id = 'url', refresh = False),
@@ -743,7 +1648,32 @@ app.layout = html.Div([
 className="dash-bootstrap"
 )
 
+# command line modes that must not load the app datastore
+BENCHMARKS = {
+  '--bench-attrs'        : bench_attr_classification,
+  '--bench-facets'       : bench_facets,
+  '--bench-chain-filter' : bench_chain_filter,
+  '--bench-workers'      : bench_workers,
+}
+if __name__ == '__main__':
+  if '--publish' in sys.argv:
+    # loader mode : always build from the dump & publish for workers, never attach
+    mmap_file_path = DATASTORE_MMAP_PATH or './dataStore.mmap'
+    size = publish_datastore( dataStore(), mmap_file_path )
+    print( 'Published datastore', mmap_file_path, size, 'bytes' )
+    sys.exit( 0 )
+  for flag, bench in BENCHMARKS.items():
+    if flag in sys.argv:
+      bench()
+      sys.exit( 0 )
+
 pageStore = pages()
+renderer  = renderExecutor()
+
+# queue & timeout counters
+@server.route('/stats')
+def render_stats():
+    return flask.jsonify( renderer.stats() )
 
 #########################
 # base index callable
@@ -755,15 +1685,44 @@ def display_page( href ):
     pathname = urlparse( href ).path
     print('Request', pathname, href )
     if pathname == '/':
-        return pageStore.display_page_1( )
+        route, args, build = '/', (), pageStore.display_page_1
     elif pathname.count('/chain') == 1:
         attributes = decode_url( href )
-        return pageStore.display_page_2( chaincode=attributes.get('ChainCode',None) )
+        route, args, build = '/chain', ( attributes.get('ChainCode',None), ), pageStore.display_page_2
     elif pathname.count('/hotel') == 1:
         attributes = decode_url( href )
-        return pageStore.display_page_3( hotelcode=attributes.get('HotelCode',None) )
+        route, args, build = '/hotel', ( attributes.get('HotelCode',None), ), pageStore.display_page_3
     else:
         return pageStore._404()
+    # cached pages skip the executor
+    page = pageStore.cached_page( route, *args )
+    if page is not None:
+        return page
+    def fallback( reason ):
+        if reason == 'busy':
+            return pageStore._placeholder( "Server busy, please retry shortly", href )
+        return pageStore._placeholder( "Page is being prepared, please refresh shortly", href )
+    return renderer.render( route + repr(args), RENDER_TIMEOUTS[route], fallback, build, *args )
+
+#########################
+# chain page filters
+@app.callback(
+              [ Output('chain-graph', 'figure'),
+                Output('chain-navbar', 'children'),
+                Output('chain-count', 'children') ] +
+              [ Output('facet-'+facet, 'options') for facet, _ in FACET_LABELS ],
+              [ Input('facet-chain', 'data') ] +
+              [ Input('facet-'+facet, 'value') for facet, _ in FACET_LABELS ],
+              # display_page_2 already rendered the unfiltered chain
+              prevent_initial_call=True
+              )
+def filter_chain_page( chaincode, *values ):
+    selections = { facet : value for ( facet, _ ), value in zip( FACET_LABELS, values ) }
+    def fallback( reason ):
+        # keep current graph & options
+        return [ dash.no_update ] * ( 3 + len(FACET_LABELS) )
+    return renderer.render( '/chain/filter' + repr( ( chaincode, selections ) ), RENDER_TIMEOUTS['/chain'],
+                            fallback, pageStore.filter_page_2, chaincode, selections )
 
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file